@@ -1,4 +1,4 @@
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, request, send_file, jsonify, g
 from flask_cors import CORS
 from docx import Document
 from docx.shared import Inches, RGBColor, Pt, Cm
@@ -7,7 +7,13 @@ from docx.oxml.ns import qn
 from docx.enum.table import WD_TABLE_ALIGNMENT
 from docx.enum.text import WD_LINE_SPACING
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
+import gc
+import logging
+import os
 import socket
+import threading
+import tracemalloc
 from contextlib import contextmanager
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
@@ -18,6 +24,18 @@ from datetime import datetime  # Manejo de fechas
 
 app = Flask(__name__)
 
+# --- Límites de memoria (configurables por entorno) ---
+# Tamaño máximo del JSON de entrada (acota también el tamaño del árbol python-docx)
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("DOC_MAX_CONTENT_LENGTH", 4 * 1024 * 1024))
+# Salidas .docx por encima de este tamaño se vuelcan a un archivo temporal en disco
+SPOOL_MAX_BYTES = int(os.environ.get("DOC_SPOOL_MAX_BYTES", 1024 * 1024))
+# Perfilado de memoria opcional (tracemalloc + RSS); tiene costo, solo para diagnóstico
+MEM_PROFILE = os.environ.get("DOC_MEM_PROFILE", "").strip().lower() in ("1", "true", "yes", "on")
+
+if MEM_PROFILE:
+    tracemalloc.start()
+    app.logger.setLevel(logging.INFO)
+
 # --- Health check (Render / monitoring) ---
 
 from flask import jsonify
@@ -31,7 +49,110 @@ def root():
     return jsonify(service="coe-word-service", ok=True)
 
 
+# ============================================================
+# PERFILADO DE MEMORIA (opcional, DOC_MEM_PROFILE=1)
+# ============================================================
+
+def _rss_kb():
+    """RSS actual del proceso en KB (solo Linux, vía /proc); None si no está disponible."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except Exception:
+        return None
+
+
+# tracemalloc lleva un único pico por proceso: antes de cada reset_peak() se
+# reparte el pico acumulado entre todas las mediciones en curso (de cualquier hilo)
+_perfiles_lock = threading.Lock()
+_perfiles_activos = {}
+
 
+def _acumular_pico():
+    """Suma el pico actual a cada medición en curso (llamar con el lock tomado)."""
+    actual, pico = tracemalloc.get_traced_memory()
+    for perfil in _perfiles_activos.values():
+        perfil["pico"] = max(perfil["pico"], pico - perfil["inicio"])
+    return actual
+
+
+def _perfil_abrir():
+    """Inicia una medición (request o etapa) y reinicia el pico de tracemalloc."""
+    with _perfiles_lock:
+        inicio = _acumular_pico()
+        perfil = {"inicio": inicio, "pico": 0}
+        _perfiles_activos[id(perfil)] = perfil
+        tracemalloc.reset_peak()
+    return perfil
+
+
+def _perfil_cerrar(perfil):
+    """Termina la medición. Devuelve (pico, delta) en KB, nunca negativos."""
+    with _perfiles_lock:
+        actual = _acumular_pico()
+        _perfiles_activos.pop(id(perfil), None)
+    return perfil["pico"] // 1024, max(actual - perfil["inicio"], 0) // 1024
+
+
+@contextmanager
+def _perfil_etapa(nombre: str):
+    """
+    Registra el pico de memoria (tracemalloc) y el RSS de una etapa del request.
+    Sin DOC_MEM_PROFILE no hace nada. Con varios hilos, tracemalloc mide el
+    proceso completo: los picos pueden incluir memoria de otros requests.
+    """
+    etapas = g.get("mem_etapas")
+    if etapas is None:
+        yield
+        return
+
+    perfil = _perfil_abrir()
+    try:
+        yield
+    finally:
+        pico, delta = _perfil_cerrar(perfil)
+        etapas.append((nombre, pico, delta, _rss_kb()))
+
+
+@app.before_request
+def _perfil_inicio_request():
+    if MEM_PROFILE:
+        g.mem_perfil = _perfil_abrir()
+        g.mem_etapas = []
+
+
+@app.after_request
+def _perfil_fin_request(response):
+    perfil = g.pop("mem_perfil", None)
+    if perfil is None:
+        return response
+
+    pico_kb, _ = _perfil_cerrar(perfil)
+    rss = _rss_kb()
+    for nombre, pico_etapa, delta, rss_etapa in g.mem_etapas:
+        app.logger.info(
+            "mem %s etapa=%s pico=%dKB delta=%dKB rss=%sKB",
+            request.path, nombre, pico_etapa, delta, rss_etapa,
+        )
+    app.logger.info("mem %s request pico=%dKB rss=%sKB", request.path, pico_kb, rss)
+
+    response.headers["X-Mem-Peak-KB"] = str(pico_kb)
+    if rss is not None:
+        response.headers["X-Mem-RSS-KB"] = str(rss)
+    return response
+
+
+@app.teardown_request
+def _perfil_cierre_request(exc=None):
+    # si el request falló antes de after_request, no dejar la medición colgada
+    perfil = g.pop("mem_perfil", None)
+    if perfil is not None:
+        _perfil_cerrar(perfil)
+
+
+@app.errorhandler(413)
+def payload_demasiado_grande(e):
+    return jsonify({"error": "Payload demasiado grande"}), 413
 
 
 
@@ -154,6 +275,53 @@ def _render_static_map(lat_f: float, lon_f: float, zoom: int):
     m.add_marker(marker)
     return m.render(zoom=zoom)
 
+
+def _guardar_docx(doc: Document):
+    """
+    Guarda el documento en un archivo temporal "spooled": en memoria hasta
+    DOC_SPOOL_MAX_BYTES y, por encima, en disco.
+    """
+    salida = SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        with _perfil_etapa("guardar"):
+            doc.save(salida)
+    except BaseException:
+        salida.close()
+        raise
+    return salida
+
+
+def _enviar_docx(salida, fname: str):
+    """
+    Envía el .docx guardado (el archivo se cierra al terminar la respuesta).
+    Debe llamarse cuando ya no quedan referencias al documento.
+    """
+    size = salida.tell()
+    salida.seek(0)
+
+    if size <= SPOOL_MAX_BYTES:
+        # sigue en memoria (el archivo solo crece): enviar un BytesIO, porque
+        # gunicorn llama a fileno() y eso volcaría a disco el SpooledTemporaryFile
+        datos = BytesIO(salida.read())
+        salida.close()
+        salida = datos
+    else:
+        # salida grande: el árbol python-docx tiene ciclos de referencias, se
+        # libera ya con una recolección completa en lugar de esperar al GC.
+        # En salidas chicas no se paga ese costo (bloquea a los demás hilos).
+        gc.collect()
+
+    rv = send_file(
+        salida,
+        as_attachment=True,
+        download_name=fname,
+        mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    )
+    # send_file no calcula el tamaño de un archivo en disco
+    rv.content_length = size
+    return rv
+
+
 def ensure_paragraph_runs(p):
     """Asegura que el párrafo tenga al menos un run."""
     if not p.runs:
@@ -270,6 +438,15 @@ def insertar_tabla_ubicacion_y_mapa(doc: Document, data: dict):
     elif "incendios forestales" in peligro or "incendio forestal" in peligro:
         zoom = 13
 
+    with _perfil_etapa("mapa"):
+        _insertar_mapa(doc, lat_f, lon_f, zoom, lat_raw, lon_raw)
+
+
+def _insertar_mapa(doc: Document, lat_f: float, lon_f: float, zoom: int, lat_raw: str, lon_raw: str):
+    """
+    Renderiza el mapa y lo inserta como PNG. La imagen PIL y el PNG intermedio
+    se liberan apenas python-docx copia los bytes al documento.
+    """
     try:
         # Render de mapa: proteger contra demoras (teselas OSM / red)
         img = None
@@ -282,16 +459,20 @@ def insertar_tabla_ubicacion_y_mapa(doc: Document, data: dict):
                     img = fut.result(timeout=3.0)
                 except FuturesTimeoutError:
                     img = None
+                del fut  # el futuro también retiene la imagen
 
         if img is None:
             raise TimeoutError("timeout mapa")
 
         stream = BytesIO()
         img.save(stream, format="PNG")
+        img.close()
+        del img
         stream.seek(0)
         p_map = doc.add_paragraph()
         run_map = p_map.add_run()
         run_map.add_picture(stream, width=Cm(12), height=Cm(8))
+        stream.close()
 
     except Exception:
         p = doc.add_paragraph(
@@ -313,6 +494,16 @@ def generar_word_rp():
     if not data:
         return jsonify({"error": "Sin datos"}), 400
 
+    with _perfil_etapa("construir"):
+        salida, fname = _construir_word_rp(data)
+    return _enviar_docx(salida, fname)
+
+
+def _construir_word_rp(data: dict):
+    """
+    Arma el Word RP y lo guarda. Devuelve (salida, fname): al retornar mueren
+    todas las referencias al árbol python-docx, que puede liberarse antes de enviar.
+    """
     doc = Document()
     configurar_cabeceras(doc)
 
@@ -465,16 +656,7 @@ def generar_word_rp():
     fname = f"{numero_global_str}_{codigo_for_name}_{peligro_name}_{distrito_name}_{dep_name}_{fecha_compact}.docx"
 
     # Exportar
-    buf = BytesIO()
-    doc.save(buf)
-    buf.seek(0)
-
-    return send_file(
-        buf,
-        as_attachment=True,
-        download_name=fname,
-        mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    )
+    return _guardar_docx(doc), fname
 
 
 # ============================================================
@@ -487,6 +669,16 @@ def generar_word_rc():
     if not data:
         return jsonify({"error": "Sin datos"}), 400
 
+    with _perfil_etapa("construir"):
+        salida, fname = _construir_word_rc(data)
+    return _enviar_docx(salida, fname)
+
+
+def _construir_word_rc(data: dict):
+    """
+    Arma el Word RC y lo guarda. Devuelve (salida, fname): al retornar mueren
+    todas las referencias al árbol python-docx, que puede liberarse antes de enviar.
+    """
     doc = Document()
     configurar_cabeceras(doc)
 
@@ -654,16 +846,7 @@ def generar_word_rc():
 
     fname = f"{numero_global_str}_{codigo_for_name}_{peligro_name}_{distrito_name}_{dep_name}_{fecha_compact}.docx"
 
-    buf = BytesIO()
-    doc.save(buf)
-    buf.seek(0)
-
-    return send_file(
-        buf,
-        as_attachment=True,
-        download_name=fname,
-        mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    )
+    return _guardar_docx(doc), fname
 
 
 # ============================================================
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# app.py vive en la raíz del repo (no es un paquete instalable)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)  # la cabecera se carga con ruta relativa
+sys.path.insert(0, ROOT)
@@ -0,0 +1,96 @@
+import tracemalloc
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+import pytest
+from docx import Document
+from PIL import Image
+
+import app as servicio
+
+PAYLOAD = {
+    "codigo": "TEST-001",
+    "peligro": "Sismo",
+    "departamento": "Lima",
+    "provincia": "Lima",
+    "distrito": "Miraflores",
+    "latitud": "-12.12",
+    "longitud": "-77.03",
+    "fechaHora": "2024-05-01T10:30:00Z",
+    "daniosMIDIS": {"Qali Warma": {"usuariosAfectados": 10}},
+    "accionesPreliminar": [{"fecha": "2024-05-01", "descripcion": "Evaluación"}],
+    "accionesRC": [{"fecha": "2024-05-02", "descripcion": "Entrega"}],
+}
+
+RUTAS = ["/api/generar-word-rp", "/api/generar-word-rc"]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # sin red: el mapa se reemplaza por una imagen fija
+    monkeypatch.setattr(
+        servicio, "_render_static_map", lambda lat, lon, zoom: Image.new("RGB", (800, 600), "white")
+    )
+    return servicio.app.test_client()
+
+
+@pytest.mark.parametrize("ruta", RUTAS)
+@pytest.mark.parametrize(
+    "spool_max, tipo_enviado",
+    [(1024 * 1024, BytesIO), (1024, SpooledTemporaryFile)],  # en memoria / volcado a disco
+)
+def test_genera_docx_valido(client, monkeypatch, ruta, spool_max, tipo_enviado):
+    monkeypatch.setattr(servicio, "SPOOL_MAX_BYTES", spool_max)
+    enviados = []
+    send_file = servicio.send_file
+
+    def espia_send_file(archivo, **kwargs):
+        enviados.append(archivo)
+        return send_file(archivo, **kwargs)
+
+    monkeypatch.setattr(servicio, "send_file", espia_send_file)
+    resp = client.post(ruta, json=PAYLOAD)
+
+    assert resp.status_code == 200
+    assert len(enviados) == 1 and isinstance(enviados[0], tipo_enviado)
+    assert resp.content_length == len(resp.data)
+    doc = Document(BytesIO(resp.data))
+    assert len(doc.inline_shapes) == 1  # mapa
+    assert any("TEST-001" in p.text for p in doc.paragraphs)
+
+
+@pytest.mark.parametrize("ruta", RUTAS)
+def test_headers_perfil_memoria(client, monkeypatch, ruta):
+    monkeypatch.setattr(servicio, "MEM_PROFILE", True)
+    iniciado = tracemalloc.is_tracing()
+    if not iniciado:
+        tracemalloc.start()
+    try:
+        resp = client.post(ruta, json=PAYLOAD)
+    finally:
+        if not iniciado:
+            tracemalloc.stop()
+
+    assert resp.status_code == 200
+    assert int(resp.headers["X-Mem-Peak-KB"]) > 0
+    if "X-Mem-RSS-KB" in resp.headers:
+        assert int(resp.headers["X-Mem-RSS-KB"]) > 0
+    assert servicio._perfiles_activos == {}
+
+
+def test_sin_perfil_no_hay_headers(client, monkeypatch):
+    monkeypatch.setattr(servicio, "MEM_PROFILE", False)
+    resp = client.post(RUTAS[0], json=PAYLOAD)
+
+    assert resp.status_code == 200
+    assert "X-Mem-Peak-KB" not in resp.headers
+    assert "X-Mem-RSS-KB" not in resp.headers
+    assert servicio._perfiles_activos == {}
+
+
+def test_payload_grande_responde_json(client, monkeypatch):
+    monkeypatch.setitem(servicio.app.config, "MAX_CONTENT_LENGTH", 100)
+    resp = client.post(RUTAS[0], json=PAYLOAD)
+
+    assert resp.status_code == 413
+    assert resp.get_json() == {"error": "Payload demasiado grande"}